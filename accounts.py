@@ -0,0 +1,61 @@
+import dataclasses
+import os
+
+import auth as auth_lib
+import classifier
+import prompts
+import work_queue
+
+# One subdirectory per mailbox, named after the account's email address, e.g.
+#   accounts/me@example.com/token.json
+#   accounts/me@example.com/TRIAGE.md
+#   accounts/me@example.com/queue.db  (created on first poll)
+#   accounts/me@example.com/history.npz  (created on first poll)
+ACCOUNTS_DIR = './accounts'
+
+
+@dataclasses.dataclass
+class Account:
+  name: str
+  token_file: str
+  triage_md: str
+  queue_db: str
+  history_file: str
+  # Monotonic time at which the account is next due to be polled.
+  next_poll: float = 0.0
+
+
+def load_accounts(directory: str = ACCOUNTS_DIR) -> list[Account]:
+  """Loads every account under `directory` that has a user token."""
+  if not os.path.isdir(directory):
+    raise FileNotFoundError(
+        f'No accounts directory at {directory}; see "Triage multiple '
+        'accounts" in README.md.'
+    )
+  accounts = []
+  for name in sorted(os.listdir(directory)):
+    account_dir = os.path.join(directory, name)
+    token_file = os.path.join(account_dir, auth_lib.USER_TOKEN_FILE)
+    if not os.path.exists(token_file):
+      continue
+    accounts.append(
+        Account(
+            name=name,
+            token_file=token_file,
+            triage_md=os.path.join(
+                account_dir, os.path.basename(prompts.TRIAGE_MD)
+            ),
+            queue_db=os.path.join(
+                account_dir, os.path.basename(work_queue.QUEUE_DB)
+            ),
+            history_file=os.path.join(
+                account_dir, os.path.basename(classifier.HISTORY_FILE)
+            ),
+        )
+    )
+  return accounts
+
+
+if __name__ == '__main__':
+  for a in load_accounts():
+    print(a.name, a.token_file)
@@ -3,26 +3,38 @@ import os
 import sys
 import time
 
+import accounts as accounts_lib
 import auth as auth_lib
 import calendar_tool
+import classifier
 import gmail_agent
 import gmail_tool
 import log
 import prompts
+import work_queue
 
-from google import genai
-from google.genai import types
+# Heavy dependencies (google-genai, googleapiclient, the Google auth libraries
+# and NumPy) are imported where they are first used rather than here, so that
+# e.g. `agent.py chat` reaches its prompt quickly. See bench_startup.py.
 
 INTERVAL = 60  # 1 minute
+MAX_WORKERS = 8
+# Threads triaged per account per poll in `accounts` mode, so that one large
+# backlog cannot hold a worker, and the Gemini slots, for long. The rest are
+# carried over to the account's next poll.
+MAX_THREADS_PER_POLL = 20
 
 
 class Agent:
 
   def __init__(self):
+    from google import genai
+
     self._client = genai.Client(api_key=os.environ.get('GEMINI_API_KEY'))
-    self._last_ckpt = datetime.datetime.now(datetime.UTC)
 
   def call(self, user_input: str) -> str:
+    from google.genai import types
+
     credentials = auth_lib.get_credentials()
     config = types.GenerateContentConfig(
         tools=[
@@ -38,6 +50,9 @@ class Agent:
     return response.text
 
   def run(self, gmail: bool = True, calendar: bool = False) -> None:
+    queue = work_queue.WorkQueue()
+    history = classifier.NeighbourClassifier()
+    last_ckpt = queue.get_checkpoint()
     while True:
       creds = auth_lib.get_credentials()
 
@@ -45,30 +60,135 @@ class Agent:
         log.log('Fetching latest events...')
         latest_events = calendar_tool.get_events_impl(
             calendar_tool.get_calendar_service(creds),
-            updated_since=self._last_ckpt,
+            updated_since=last_ckpt,
         )
 
       if gmail:
         log.log('Fetching latest emails...')
-        latest_emails = gmail_tool.get_emails_impl(
-            gmail_tool.get_gmail_service(creds),
-            # received_since=self._last_ckpt,
+        service = gmail_tool.get_gmail_service(creds)
+        latest_threads = gmail_tool.get_threads_impl(
+            service,
+            # received_since=last_ckpt,
             unread_only=True,
+            known_ids=queue,
+        )
+        last_ckpt = datetime.datetime.now(datetime.UTC)
+        queue.set_checkpoint(last_ckpt)
+
+        # Always runs, to resume anything left pending by a previous run.
+        gmail_agent.triage(
+            latest_threads,
+            queue,
+            service=service,
+            history=history,
         )
-        self._last_ckpt = datetime.datetime.now(datetime.UTC)
-
-        if latest_emails:
-          gmail_agent.triage(latest_emails)
 
       time.sleep(INTERVAL)
 
 
-if __name__ == '__main__':
-  agent = Agent()
+class AccountPool:
+  """Triages many mailboxes from one process.
+
+  Each account is polled at most once per `interval`, never has more than one
+  poll in flight, and due accounts are served oldest-first so a slow mailbox
+  cannot starve the others. Gemini calls are capped process-wide by
+  `gmail_agent.GEMINI_CONCURRENCY`.
+  """
+
+  def __init__(
+      self,
+      accounts: list[accounts_lib.Account],
+      max_workers: int = MAX_WORKERS,
+      interval: float = INTERVAL,
+  ):
+    if not accounts:
+      # Otherwise run() would wait forever with nothing to poll.
+      raise ValueError('No accounts to triage.')
+    self._accounts = accounts
+    self._max_workers = max_workers
+    self._interval = interval
+
+  def poll(self, account: accounts_lib.Account) -> None:
+    # A browser sign-in would block a worker indefinitely, so an account whose
+    # token cannot be refreshed just fails its poll.
+    creds = auth_lib.get_credentials(account.token_file, interactive=False)
+    service = gmail_tool.get_gmail_service(creds)
+    # SQLite connections cannot be shared across threads, so each poll opens
+    # its own.
+    queue = work_queue.WorkQueue(account.queue_db)
+    try:
+      log.log(f'[{account.name}] Fetching latest emails...')
+      latest_threads = gmail_tool.get_threads_impl(
+          service,
+          unread_only=True,
+          known_ids=queue,
+      )
+
+      gmail_agent.triage(
+          latest_threads,
+          queue,
+          service=service,
+          triage_md=account.triage_md,
+          history=classifier.NeighbourClassifier(account.history_file),
+          limit=MAX_THREADS_PER_POLL,
+      )
+    finally:
+      queue.close()
+
+  def run(self) -> None:
+    import concurrent.futures
+
+    in_flight: dict[concurrent.futures.Future, accounts_lib.Account] = {}
+    with concurrent.futures.ThreadPoolExecutor(self._max_workers) as executor:
+      while True:
+        now = time.monotonic()
+        busy = {a.name for a in in_flight.values()}
+        due = sorted(
+            (
+                a for a in self._accounts
+                if a.name not in busy and a.next_poll <= now
+            ),
+            key=lambda a: a.next_poll,
+        )
+        for account in due:
+          in_flight[executor.submit(self.poll, account)] = account
 
+        busy = {a.name for a in in_flight.values()}
+        next_due = min(
+            (a.next_poll for a in self._accounts if a.name not in busy),
+            default=now + self._interval,
+        )
+        timeout = max(next_due - now, 1.0)
+        if not in_flight:
+          time.sleep(timeout)
+          continue
+
+        done, _ = concurrent.futures.wait(
+            in_flight,
+            timeout=timeout,
+            return_when=concurrent.futures.FIRST_COMPLETED,
+        )
+        for future in done:
+          account = in_flight.pop(future)
+          account.next_poll = time.monotonic() + self._interval
+          if future.exception():
+            log.log(f'[{account.name}] Poll failed: {future.exception()}')
+
+
+if __name__ == '__main__':
   if len(sys.argv) > 1 and sys.argv[1] == 'chat':
     user_input = input('> ')
-    print(agent.call(user_input))
+    print(Agent().call(user_input))
+
+  elif len(sys.argv) > 1 and sys.argv[1] == 'accounts':
+    directory = sys.argv[2] if len(sys.argv) > 2 else accounts_lib.ACCOUNTS_DIR
+    accounts = accounts_lib.load_accounts(directory)
+    if not accounts:
+      sys.exit(
+          f'No accounts with a {auth_lib.USER_TOKEN_FILE} under {directory}; '
+          'see "Triage multiple accounts" in README.md.'
+      )
+    AccountPool(accounts).run()
 
   else:
-    agent.run()
+    Agent().run()
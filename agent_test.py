@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import unittest
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Loaded where they are first used, never on import; see bench_startup.py.
+LAZY_MODULES = [
+    'google.genai',
+    'googleapiclient',
+    'google.auth',
+    'backoff',
+    'httplib2',
+    'numpy',
+]
+
+
+class StartupTest(unittest.TestCase):
+
+  def test_entry_points_do_not_import_heavy_modules(self):
+    # A fresh interpreter, since this one may have imported them already.
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-c',
+            'import sys, agent, auth; print("\\n".join(sys.modules))',
+        ],
+        cwd=_REPO_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    loaded = [
+        name
+        for name in result.stdout.split()
+        if any(name == m or name.startswith(f'{m}.') for m in LAZY_MODULES)
+    ]
+    self.assertEqual(loaded, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
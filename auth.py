@@ -1,8 +1,9 @@
 import os.path
+import sys
+from typing import TYPE_CHECKING
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow  # type: ignore
+if TYPE_CHECKING:
+  from google.oauth2.credentials import Credentials
 
 USER_TOKEN_FILE = "token.json"
 OAUTH_CREDS_FILE = "credentials.json"
@@ -14,23 +15,42 @@ SCOPES = [
 ]
 
 
-def get_credentials() -> Credentials:
-  """Loads or generates user credentials."""
+def get_credentials(
+    token_file: str = USER_TOKEN_FILE,
+    interactive: bool = True,
+) -> 'Credentials':
+  """Loads or generates user credentials, stored in `token_file`.
+
+  If the stored token cannot be refreshed, a browser sign-in is started, or
+  with `interactive=False` a RuntimeError is raised instead.
+  """
+  # The Google auth libraries are slow to import, so only load them when
+  # credentials are actually needed.
+  from google.auth.transport.requests import Request
+  from google.oauth2.credentials import Credentials
+  from google_auth_oauthlib.flow import InstalledAppFlow  # type: ignore
+
   creds = None
-  if os.path.exists(USER_TOKEN_FILE):
-    creds = Credentials.from_authorized_user_file(USER_TOKEN_FILE, SCOPES)
+  if os.path.exists(token_file):
+    creds = Credentials.from_authorized_user_file(token_file, SCOPES)
   if not creds or not creds.valid:
     if creds and creds.expired and creds.refresh_token:
       creds.refresh(Request())
+    elif not interactive:
+      raise RuntimeError(
+          f'No valid credentials in {token_file}; '
+          f'run `python3 auth.py {token_file}` to sign in again.'
+      )
     else:
       flow = InstalledAppFlow.from_client_secrets_file(
           OAUTH_CREDS_FILE, SCOPES
       )
       creds = flow.run_local_server(port=0)
-  with open(USER_TOKEN_FILE, "w") as token:
+  with open(token_file, "w") as token:
     token.write(creds.to_json())
   return creds
 
 
 if __name__ == '__main__':
-  get_credentials()
+  # Optionally pass a token path, e.g. `accounts/me@example.com/token.json`.
+  get_credentials(sys.argv[1] if len(sys.argv) > 1 else USER_TOKEN_FILE)
@@ -0,0 +1,93 @@
+"""Measures how long the agent's entry points take to import.
+
+Every measurement runs in a fresh interpreter, so it includes everything the
+module pulls in. `agent` is what `agent.py chat` has to load before showing its
+prompt. The `eager` row also imports the heavy dependencies up front, which is
+roughly what every entry point paid before they were loaded lazily.
+
+  python3 bench_startup.py [--runs N] [--top N]
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = ['auth', 'agent']
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+HEAVY_MODULES = [
+    'google.genai',
+    'googleapiclient.discovery',
+    'google_auth_oauthlib.flow',
+    'backoff',
+    'httplib2',
+    'requests',
+    'numpy',
+]
+
+
+def _is_installed(module: str) -> bool:
+  try:
+    return importlib.util.find_spec(module) is not None
+  except ModuleNotFoundError:
+    return False
+
+
+def _time_code(code: str, runs: int) -> float:
+  """Returns the median wall time, in seconds, of running `code` in python."""
+  times = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], cwd=_REPO_DIR, check=True)
+    times.append(time.perf_counter() - start)
+  return statistics.median(times)
+
+
+def _slowest_imports(module: str, top: int) -> list[tuple[int, str]]:
+  """Returns the `top` imports under `module` by cumulative microseconds."""
+  result = subprocess.run(
+      [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+      cwd=_REPO_DIR,
+      capture_output=True,
+      text=True,
+      check=True,
+  )
+  rows = []
+  for line in result.stderr.splitlines():
+    fields = line.split('|')
+    # Skips the header and anything else on stderr, such as warnings.
+    if len(fields) != 3 or not fields[1].strip().isdigit():
+      continue
+    rows.append((int(fields[1]), fields[2].strip()))
+  return sorted(rows, reverse=True)[:top]
+
+
+def main() -> None:
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--runs', type=int, default=10)
+  parser.add_argument('--top', type=int, default=10)
+  args = parser.parse_args()
+
+  rows = [('interpreter', 'pass')]
+  rows += [(module, f'import {module}') for module in ENTRY_POINTS]
+  heavy = [m for m in HEAVY_MODULES if _is_installed(m)]
+  if heavy:
+    rows.append(('eager', '; '.join(f'import {m}' for m in ['agent'] + heavy)))
+
+  for name, code in rows:
+    print(f'{name:<12} {_time_code(code, args.runs) * 1000:8.1f} ms')
+  missing = sorted(set(HEAVY_MODULES) - set(heavy))
+  if missing:
+    print(f'(not installed, so not in `eager`: {", ".join(missing)})')
+
+  print('\nSlowest imports under `agent`:')
+  for cumulative, name in _slowest_imports('agent', args.top):
+    print(f'{cumulative / 1000:8.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+  main()
@@ -1,14 +1,14 @@
 import dataclasses
 import datetime
 import os
-from typing import Any, Callable, no_type_check
+from typing import TYPE_CHECKING, Any, Callable, no_type_check
 from zoneinfo import ZoneInfo
 
 import auth as auth_lib
+import discovery_docs
 
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build  # type: ignore
-from googleapiclient.errors import HttpError  # type: ignore
+if TYPE_CHECKING:
+  from google.oauth2.credentials import Credentials
 
 CalendarService = Any
 
@@ -73,9 +73,11 @@ class CalendarEvent:
     )
 
 
-def get_calendar_service(credentials: Credentials) -> CalendarService | None:
+def get_calendar_service(credentials: 'Credentials') -> CalendarService | None:
+  from googleapiclient.errors import HttpError  # type: ignore
+
   try:
-    service = build('calendar', 'v3', credentials=credentials)
+    service = discovery_docs.build_service('calendar', 'v3', credentials)
     return service
   except HttpError as error:
     print(f'An error occurred: {error}')
@@ -147,7 +149,7 @@ def get_events_impl(
   return parsed_events
 
 
-def make_get_events_tool(credentials: Credentials) -> Callable:
+def make_get_events_tool(credentials: 'Credentials') -> Callable:
   service = get_calendar_service(credentials)
 
   def get_events(
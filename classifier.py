@@ -0,0 +1,168 @@
+import dataclasses
+import os
+import re
+import sys
+import zlib
+from typing import TYPE_CHECKING
+
+import gmail_tool
+
+if TYPE_CHECKING:
+  import numpy as np
+
+HISTORY_FILE = './history.npz'
+
+NUM_FEATURES = 2**10
+MAX_HISTORY = 2000
+NUM_NEIGHBOURS = 5
+# The neighbours decide on their own only if every one of them is at least this
+# similar, and the winning decision has this share of the similarity-weighted
+# vote.
+MIN_SIMILARITY = 0.5
+MIN_CONFIDENCE = 0.8
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_SNIPPET_CHARS = 200
+
+
+def _fields(thread: gmail_tool.EmailThread) -> list[tuple[str, str]]:
+  latest = thread.newest_message
+  return [
+      ('sender', latest.sender if latest else ''),
+      ('subject', thread.subject),
+      ('snippet', latest.snippet if latest else ''),
+  ]
+
+
+def featurize(thread: gmail_tool.EmailThread) -> 'np.ndarray':
+  """Hashes the sender, subject and snippet of `thread` into a unit vector."""
+  import numpy as np
+
+  vector = np.zeros(NUM_FEATURES, dtype=np.float32)
+  for field, text in _fields(thread):
+    for token in _TOKEN_RE.findall(text.lower()):
+      # crc32 rather than hash(), which is salted per process.
+      h = zlib.crc32(f'{field}:{token}'.encode())
+      vector[h % NUM_FEATURES] += -1.0 if h >> 31 else 1.0
+  norm = np.linalg.norm(vector)
+  if norm:
+    vector /= norm
+  return vector
+
+
+def describe(thread: gmail_tool.EmailThread) -> str:
+  """A short description of `thread`, for use as a few-shot example."""
+  sender, subject, snippet = (text for _, text in _fields(thread))
+  return (
+      f'Subject: {subject}\n'
+      f'Sender: {sender}\n'
+      f'{snippet[:_SNIPPET_CHARS]}'
+  )
+
+
+@dataclasses.dataclass
+class Neighbour:
+  example: str
+  decision: str
+  similarity: float
+
+
+def vote(neighbours: list[Neighbour]) -> str | None:
+  """Returns the neighbours' decision, or None if they are not confident."""
+  if len(neighbours) < NUM_NEIGHBOURS:
+    return None
+  if any(n.similarity < MIN_SIMILARITY for n in neighbours):
+    return None
+  votes: dict[str, float] = {}
+  for n in neighbours:
+    votes[n.decision] = votes.get(n.decision, 0.0) + n.similarity
+  decision = max(votes, key=lambda d: votes[d])
+  if votes[decision] / sum(votes.values()) < MIN_CONFIDENCE:
+    return None
+  return decision
+
+
+class NeighbourClassifier:
+  """Nearest-neighbour lookup over past triage decisions, stored in `path`.
+
+  Only the most recent `MAX_HISTORY` decisions are kept. NumPy is imported
+  per method so that code paths which never triage do not pay for it.
+  """
+
+  def __init__(self, path: str = HISTORY_FILE):
+    import numpy as np
+
+    self._path = path
+    self._unsaved = False
+    self._vectors = np.zeros((0, NUM_FEATURES), dtype=np.float32)
+    self._decisions = np.array([], dtype=str)
+    self._examples = np.array([], dtype=str)
+    if os.path.exists(path):
+      with np.load(path) as data:
+        self._vectors = data['vectors']
+        self._decisions = data['decisions']
+        self._examples = data['examples']
+
+  def __len__(self) -> int:
+    return len(self._decisions)
+
+  def decision_counts(self) -> dict[str, int]:
+    """Returns how many stored examples there are of each decision."""
+    counts: dict[str, int] = {}
+    for decision in self._decisions:
+      counts[str(decision)] = counts.get(str(decision), 0) + 1
+    return counts
+
+  def neighbours(
+      self,
+      thread: gmail_tool.EmailThread,
+      k: int = NUM_NEIGHBOURS,
+  ) -> list[Neighbour]:
+    """Returns up to `k` past threads most similar to `thread`."""
+    import numpy as np
+
+    if not len(self):
+      return []
+    similarities = self._vectors @ featurize(thread)
+    nearest = np.argsort(-similarities)[:k]
+    return [
+        Neighbour(
+            example=str(self._examples[i]),
+            decision=str(self._decisions[i]),
+            similarity=float(similarities[i]),
+        )
+        for i in nearest
+        if similarities[i] > 0
+    ]
+
+  def add(self, thread: gmail_tool.EmailThread, decision: str) -> None:
+    import numpy as np
+
+    self._vectors = np.vstack([self._vectors, featurize(thread)])[-MAX_HISTORY:]
+    self._decisions = np.append(self._decisions, decision)[-MAX_HISTORY:]
+    self._examples = np.append(self._examples, describe(thread))[-MAX_HISTORY:]
+    self._unsaved = True
+
+  def save(self) -> None:
+    """Writes the history to disk, if anything was added since the last save."""
+    import numpy as np
+
+    if not self._unsaved:
+      return
+    tmp_path = f'{self._path}.tmp'
+    with open(tmp_path, 'wb') as f:
+      np.savez_compressed(
+          f,
+          vectors=self._vectors,
+          decisions=self._decisions,
+          examples=self._examples,
+      )
+    os.replace(tmp_path, self._path)
+    self._unsaved = False
+
+
+if __name__ == '__main__':
+  history = NeighbourClassifier(*sys.argv[1:2])
+  print(f'{len(history)} past decisions:')
+  for decision, count in sorted(history.decision_counts().items()):
+    print(f'  {decision}: {count}')
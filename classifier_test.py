@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+
+import classifier
+import gmail_tool
+
+
+def _thread(sender: str, subject: str, snippet: str) -> gmail_tool.EmailThread:
+  message = gmail_tool.EmailMessage(
+      id='m1',
+      thread_id='t1',
+      subject=subject,
+      sender=sender,
+      snippet=snippet,
+  )
+  return gmail_tool.EmailThread(id='t1', messages=[message], newest_id='m1')
+
+
+def _neighbours(*pairs: tuple[str, float]) -> list[classifier.Neighbour]:
+  return [classifier.Neighbour('', decision, sim) for decision, sim in pairs]
+
+
+class VoteTest(unittest.TestCase):
+
+  def test_unanimous_similar_neighbours_decide(self):
+    neighbours = _neighbours(*[('ignore', 0.9)] * classifier.NUM_NEIGHBOURS)
+    self.assertEqual(classifier.vote(neighbours), 'ignore')
+
+  def test_too_few_neighbours(self):
+    pairs = [('ignore', 0.9)] * (classifier.NUM_NEIGHBOURS - 1)
+    self.assertIsNone(classifier.vote(_neighbours(*pairs)))
+
+  def test_no_neighbours(self):
+    self.assertIsNone(classifier.vote([]))
+
+  def test_dissimilar_neighbour(self):
+    pairs = [('ignore', 0.9)] * (classifier.NUM_NEIGHBOURS - 1)
+    neighbours = _neighbours(*pairs, ('ignore', classifier.MIN_SIMILARITY / 2))
+    self.assertIsNone(classifier.vote(neighbours))
+
+  def test_split_vote(self):
+    pairs = [('ignore', 0.9)] * (classifier.NUM_NEIGHBOURS - 2)
+    neighbours = _neighbours(*pairs, ('star', 0.9), ('star', 0.9))
+    self.assertIsNone(classifier.vote(neighbours))
+
+
+class NeighbourClassifierTest(unittest.TestCase):
+
+  def setUp(self):
+    self.path = os.path.join(tempfile.mkdtemp(), 'history.npz')
+
+  def test_similar_threads_are_nearest(self):
+    history = classifier.NeighbourClassifier(self.path)
+    history.add(_thread('ci@example.com', 'Build passed', 'Build 1'), 'ignore')
+    history.add(_thread('alice@example.com', 'Lunch?', 'Free?'), 'respond')
+    [nearest, *_] = history.neighbours(
+        _thread('ci@example.com', 'Build passed', 'Build 2')
+    )
+    self.assertEqual(nearest.decision, 'ignore')
+
+  def test_save_and_load(self):
+    history = classifier.NeighbourClassifier(self.path)
+    history.add(_thread('ci@example.com', 'Build passed', ''), 'ignore')
+    history.save()
+    loaded = classifier.NeighbourClassifier(self.path)
+    self.assertEqual(loaded.decision_counts(), {'ignore': 1})
+
+  def test_save_without_changes_writes_nothing(self):
+    classifier.NeighbourClassifier(self.path).save()
+    self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+  unittest.main()
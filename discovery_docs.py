@@ -0,0 +1,82 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+  from google.oauth2.credentials import Credentials
+
+DISCOVERY_DIR = './discovery'
+DISCOVERY_URL = (
+    'https://www.googleapis.com/discovery/v1/apis/{api}/{version}/rest'
+)
+
+# The APIs this package builds clients for.
+APIS = [('gmail', 'v1'), ('calendar', 'v3')]
+
+_documents: dict[tuple[str, str], str] = {}
+_lock = threading.Lock()
+
+
+def _fetch_document(api: str, version: str) -> str:
+  """Returns the copy bundled with googleapiclient, or downloads one."""
+  import urllib.request
+  from googleapiclient import discovery_cache  # type: ignore
+
+  document = discovery_cache.get_static_doc(api, version)
+  if document:
+    return document
+  url = DISCOVERY_URL.format(api=api, version=version)
+  with urllib.request.urlopen(url) as response:
+    return response.read().decode('utf-8')
+
+
+def _cache_path(api: str, version: str) -> str:
+  # Keyed by the client library version, so that upgrading googleapiclient
+  # picks up the documents bundled with the new version.
+  import googleapiclient  # type: ignore
+
+  return os.path.join(
+      DISCOVERY_DIR, f'{api}.{version}.{googleapiclient.__version__}.json'
+  )
+
+
+def get_document(api: str, version: str) -> str:
+  """Returns the discovery document for `api`, caching it on disk."""
+  key = (api, version)
+  with _lock:
+    if key in _documents:
+      return _documents[key]
+
+  # Loaded without holding the lock, so that a slow download does not block
+  # other threads. Racing threads may both load it; the results are the same.
+  path = _cache_path(api, version)
+  if os.path.exists(path):
+    with open(path, 'r') as f:
+      document = f.read()
+  else:
+    document = _fetch_document(api, version)
+    os.makedirs(DISCOVERY_DIR, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+      f.write(document)
+    os.replace(tmp_path, path)
+
+  with _lock:
+    return _documents.setdefault(key, document)
+
+
+def build_service(api: str, version: str, credentials: 'Credentials') -> Any:
+  """Builds an API client from the cached discovery document."""
+  from googleapiclient.discovery import build_from_document  # type: ignore
+
+  return build_from_document(
+      get_document(api, version),
+      credentials=credentials,
+  )
+
+
+if __name__ == '__main__':
+  # Pre-warms the on-disk cache, e.g. at deploy time.
+  for api, version in APIS:
+    get_document(api, version)
+    print(f'Cached {api} {version} in {DISCOVERY_DIR}')
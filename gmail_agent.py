@@ -1,21 +1,26 @@
 import os
-from typing import Any, Callable
+import threading
+from typing import TYPE_CHECKING, Any, Callable
 
 import auth as auth_lib
+import classifier
 import gmail_tool
 import log
 import prompts
+import work_queue
 
-from google import genai
-from google.genai import types
-from google.oauth2.credentials import Credentials
+if TYPE_CHECKING:
+  from google import genai
 
 IGNORE = 'ignore'
 STAR = 'star'
 RESPOND = 'respond'
 
+# Caps in-flight Gemini calls across every thread in the process.
+GEMINI_CONCURRENCY = 4
+_gemini_slots = threading.BoundedSemaphore(GEMINI_CONCURRENCY)
 
-TASK_PROMPT = """Your job is to help the user triage their inbox. You can either mark emails as read if you don't think the user needs to respond to them (with the option to star them for the user's offline review), or draft responses to confirm with the user.
+TASK_PROMPT = """Your job is to help the user triage their inbox, one email thread at a time. You can either mark emails as read if you don't think the user needs to respond to them (with the option to star them for the user's offline review), or draft responses to confirm with the user.
 
 Examples of emails that *do not* need a response and can be IGNORED:
   - Notifications about code changes (CLs), YAQS questions, or other automated emails
@@ -34,100 +39,265 @@ Examples of emails that *do* need a response:
 """
 
 
+def generate_content(client: 'genai.Client', **kwargs) -> Any:
+  """Calls Gemini while holding one of the shared concurrency slots."""
+  with _gemini_slots:
+    return client.models.generate_content(**kwargs)
+
+
 def make_ignore_tool(
-    message: gmail_tool.EmailMessage,
+    thread: gmail_tool.EmailThread,
     holding_dict: dict,
 ) -> Callable:
 
   def ignore() -> None:
-    """Ignores the current message and marks as read."""
-    holding_dict[IGNORE] = message
+    """Ignores the current thread and marks it as read."""
+    holding_dict[IGNORE] = thread
 
   return ignore
 
 
-def build_prompt(email: gmail_tool.EmailMessage) -> str:
+def build_prompt(
+    thread: gmail_tool.EmailThread,
+    triage_md: str = prompts.TRIAGE_MD,
+    neighbours: list[classifier.Neighbour] | None = None,
+) -> str:
   prompt = prompts.PROMPT
   prompt += TASK_PROMPT
-  prompt += prompts.user_prefs(prompts.TRIAGE_MD)
-  prompt += email.to_string(short=True)
+  prompt += prompts.user_prefs(triage_md)
+  if neighbours:
+    prompt += (
+        'Here are similar emails the user received before, and how they '
+        'were triaged:\n\n'
+    )
+    for n in neighbours:
+      prompt += f'{n.example}\nDecision: {n.decision.upper()}\n\n'
+  prompt += thread.to_string(short=True)
   return prompt
 
 
+def draft_reply(
+    client: 'genai.Client',
+    thread: gmail_tool.EmailThread,
+    triage_md: str = prompts.TRIAGE_MD,
+) -> str:
+  prompt = (
+      'Draft a response to the latest message in this email thread:\n\n'
+      f'{thread.to_string()}\n\n'
+      'ONLY include the resulting email in your response. Do not give '
+      'multiple options or explain your response.'
+  )
+  prompt += prompts.user_prefs(triage_md)
+  response = client.models.generate_content(
+      model='gemini-2.5-flash',
+      contents=prompt,
+  )
+  return response.text
+
+
 def make_respond_tool(
-    client: genai.Client,
-    message: gmail_tool.EmailMessage,
+    client: 'genai.Client',
+    thread: gmail_tool.EmailThread,
     holding_dict: dict,
+    triage_md: str = prompts.TRIAGE_MD,
 ) -> Callable:
 
   def respond() -> None:
-    """Marks an email as needing a response."""
-    prompt = (
-        f'Draft a response to this email:\n\n{message.to_string()}\n\n'
-        'ONLY include the resulting email in your response. Do not give '
-        'multiple options or explain your response.'
-    )
-    prompt += prompts.user_prefs(prompts.TRIAGE_MD)
-    response = client.models.generate_content(
-        model='gemini-2.5-flash',
-        contents=prompt,
-    )
-    holding_dict[RESPOND] = response.text
+    """Marks an email thread as needing a response."""
+    # Called from within the triage request, which already holds a slot.
+    holding_dict[RESPOND] = draft_reply(client, thread, triage_md)
 
   return respond
 
 
 def make_star_tool(
-    service: gmail_tool.GmailService,
-    message: gmail_tool.EmailMessage,
+    thread: gmail_tool.EmailThread,
     holding_dict: dict,
 ) -> Callable:
 
   def star() -> None:
-    """Stars the current message for the user to look at later."""
-    returned_message = gmail_tool.update_labels(service, message, star=True)
-    holding_dict[STAR] = message
+    """Stars the current thread for the user to look at later."""
+    holding_dict[STAR] = thread
 
   return star
 
 
-def triage(emails: list[gmail_tool.EmailMessage]):
-  client = genai.Client(api_key=os.environ.get('GEMINI_API_KEY'))
-  credentials = auth_lib.get_credentials()
-  service = gmail_tool.get_gmail_service(credentials)
-
-  for email in emails:
-    holding_dict: dict[str, Any] = {}
-    config = types.GenerateContentConfig(
-        tools=[
-            make_ignore_tool(email, holding_dict),
-            make_star_tool(service, email, holding_dict),
-            make_respond_tool(client, email, holding_dict),
-        ]
-    )
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=build_prompt(email),
-        config=config,
+def classify(
+    client: 'genai.Client',
+    thread: gmail_tool.EmailThread,
+    triage_md: str = prompts.TRIAGE_MD,
+    neighbours: list[classifier.Neighbour] | None = None,
+) -> tuple[str | None, str | None]:
+  """Asks Gemini how to triage `thread`, with a single decision for all of it.
+
+  `neighbours` are similar past threads, shown to the model as examples.
+
+  Returns:
+    The decision (IGNORE, STAR or RESPOND, or None if the model made none) and,
+    for RESPOND, the drafted reply.
+  """
+  from google.genai import types
+
+  holding_dict: dict[str, Any] = {}
+  config = types.GenerateContentConfig(
+      tools=[
+          make_ignore_tool(thread, holding_dict),
+          make_star_tool(thread, holding_dict),
+          make_respond_tool(client, thread, holding_dict, triage_md),
+      ]
+  )
+  generate_content(
+      client,
+      model="gemini-2.5-flash",
+      contents=build_prompt(thread, triage_md, neighbours),
+      config=config,
+  )
+  for decision in (IGNORE, STAR, RESPOND):
+    if decision in holding_dict:
+      return decision, holding_dict.get(RESPOND)
+  return None, None
+
+
+def decide(
+    client: 'genai.Client',
+    thread: gmail_tool.EmailThread,
+    triage_md: str = prompts.TRIAGE_MD,
+    history: classifier.NeighbourClassifier | None = None,
+) -> tuple[str | None, str | None, bool]:
+  """Triages `thread` from past decisions if they agree, otherwise via Gemini.
+
+  Returns:
+    The decision and draft, as for `classify`, and whether they came from
+    `history` rather than from Gemini.
+  """
+  neighbours = history.neighbours(thread) if history is not None else []
+  decision = classifier.vote(neighbours)
+  if decision is not None:
+    log.log(f'Decided to {decision} email {thread.subject} from past emails.')
+    draft = None
+    if decision == RESPOND:
+      with _gemini_slots:
+        draft = draft_reply(client, thread, triage_md)
+    return decision, draft, True
+
+  decision, draft = classify(client, thread, triage_md, neighbours)
+  return decision, draft, False
+
+
+def _create_draft_once(
+    service: gmail_tool.GmailService,
+    queue: work_queue.WorkQueue,
+    item: work_queue.WorkItem,
+) -> None:
+  """Creates the reply draft unless an interrupted run already created it.
+
+  The draft is tagged with its action key, so that recovery finds this draft
+  rather than one the user, or an earlier triage of the thread, left there.
+  """
+  thread = item.thread
+  if not item.draft:
+    raise ValueError('No draft text to create a draft from.')
+  key = f'draft:{thread.newest_id}'
+  draft_id = None
+  if queue.action_interrupted(key):
+    draft_id = gmail_tool.find_draft(service, thread.id, key)
+  if draft_id is None:
+    queue.start_action(key)
+    draft_id = gmail_tool.create_draft(
+        service=service,
+        message=item.draft,
+        reply_to=thread.id,
+        tag=key,
     )
-    if IGNORE in holding_dict:
-      log.log(f'Marked email {email.subject} as read.')
-    elif STAR in holding_dict:
-      log.log(f'Starred email {email.subject}.')
-    elif RESPOND in holding_dict:
-      response = holding_dict['respond']
-      first_line = response.split('\n')[0]
-      log.log(f'Drafted response to email: {first_line}')
-      gmail_tool.create_draft(
-          service=service,
-          message=response,
-          reply_to=email.thread_id if email.thread_id else email.id,
-      )
-    else:
-      log.log(f'Failed to triage email: {email.subject}')
-      continue
-
-    gmail_tool.update_labels(service, email, mark_as_read=True)
+  first_line = item.draft.split('\n')[0]
+  log.log(f'Drafted response to email: {first_line}')
+  queue.complete_action(key, draft_id, item, work_queue.DRAFTED)
+
+
+def _triage_item(
+    client: 'genai.Client',
+    service: gmail_tool.GmailService,
+    queue: work_queue.WorkQueue,
+    item: work_queue.WorkItem,
+    triage_md: str = prompts.TRIAGE_MD,
+    history: classifier.NeighbourClassifier | None = None,
+) -> None:
+  """Runs `item` through its remaining steps, raising if one of them fails."""
+  thread = item.thread
+
+  if item.state == work_queue.FETCHED:
+    decision, draft, from_history = decide(client, thread, triage_md, history)
+    if decision is None:
+      raise ValueError('Gemini made no decision.')
+    if decision == RESPOND and not draft:
+      raise ValueError('Gemini returned an empty draft.')
+    queue.advance(item, work_queue.CLASSIFIED, decision=decision, draft=draft)
+    # Only Gemini's decisions are learned from, so the classifier never
+    # reinforces its own guesses. Recorded after the queue, so a crash cannot
+    # add the same thread twice.
+    if history is not None and not from_history:
+      history.add(thread, decision)
+
+  if item.state == work_queue.CLASSIFIED and item.decision == RESPOND:
+    _create_draft_once(service, queue, item)
+
+  labeled = gmail_tool.update_thread_labels(
+      service,
+      thread,
+      star=item.decision == STAR,
+      mark_as_read=True,
+  )
+  if labeled is None:
+    raise ValueError('Could not update the thread\'s labels.')
+  queue.advance(item, work_queue.LABELED)
+  if item.decision == IGNORE:
+    log.log(f'Marked email {thread.subject} as read.')
+  elif item.decision == STAR:
+    log.log(f'Starred email {thread.subject}.')
+
+
+def triage(
+    threads: list[gmail_tool.EmailThread],
+    queue: work_queue.WorkQueue,
+    service: gmail_tool.GmailService | None = None,
+    triage_md: str = prompts.TRIAGE_MD,
+    history: classifier.NeighbourClassifier | None = None,
+    limit: int | None = None,
+):
+  """Queues `threads` and triages what is pending in `queue`.
+
+  At most `limit` threads are triaged per call, oldest first; the rest stay
+  pending for the next call. Each thread gets one decision, at most one draft and a single label update.
+  Work left over from an interrupted run is resumed from its last completed
+  step, so no thread is classified or drafted twice. A thread that fails is
+  retried on later calls once its `work_queue.RETRY_DELAY` has passed, up to
+  `work_queue.MAX_ATTEMPTS` times.
+  """
+  queue.prune()
+  queue.add(threads)
+  pending = queue.pending(limit)
+  if not pending:
+    return
+
+  from google import genai
+
+  client = genai.Client(api_key=os.environ.get('GEMINI_API_KEY'))
+  if service is None:
+    service = gmail_tool.get_gmail_service(auth_lib.get_credentials())
+
+  try:
+    for item in pending:
+      try:
+        _triage_item(client, service, queue, item, triage_md, history)
+      except Exception as e:
+        failed = queue.record_failure(item)
+        log.log(
+            f'Failed to triage email: {item.thread.subject} ({e})'
+            + (' Giving up.' if failed else '')
+        )
+  finally:
+    if history is not None:
+      history.save()
 
 
 if __name__ == '__main__':
@@ -158,4 +328,10 @@ if __name__ == '__main__':
       body='Please respond to this message with a short poem about dragons.',
       date='',
   )
-  triage([should_ignore, should_star, should_respond])
+  for email in [should_ignore, should_star, should_respond]:
+    thread = gmail_tool.EmailThread(
+        id=email.thread_id,
+        messages=[email],
+        newest_id=email.id,
+    )
+    triage([thread], work_queue.WorkQueue(':memory:'))
@@ -1,21 +1,24 @@
-import backoff
 import base64
 import dataclasses
 import datetime
-from email.message import EmailMessage as EmailMessageBuiltin
-import httplib2
+import email.utils
 import sys
-import requests
-from typing import Any, Callable, no_type_check
+from typing import (
+    TYPE_CHECKING, Any, Callable, Container, Iterator, no_type_check
+)
 
 import auth as auth_lib
+import discovery_docs
 
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build  # type: ignore
-from googleapiclient.errors import HttpError  # type: ignore
+if TYPE_CHECKING:
+  from google.oauth2.credentials import Credentials
 
 GmailService = Any
 
+# Header set on drafts the agent creates, so that they can be told apart from
+# the user's own drafts in the same thread.
+DRAFT_TAG_HEADER = 'X-Workflow-Assist-Key'
+
 
 @dataclasses.dataclass
 class EmailMessage:
@@ -37,9 +40,11 @@ class EmailMessage:
     sender = next(sender, '')
     date_str = (h["value"] for h in headers if h["name"].lower() == "date")
     date_str = next(date_str, '')
-    if '(' in date_str:
-      date_str = date_str.split("(")[0].strip()
-    date_obj = datetime.datetime.strptime(date_str, "%a, %d %b %Y %H:%M:%S %z")
+    try:
+      date_obj = email.utils.parsedate_to_datetime(date_str)
+    except ValueError:
+      # Missing, e.g. on drafts, or not in RFC 2822 format.
+      date_obj = ''
     snippet = data.get("snippet", "")
     payload = data.get("payload", {})
     body = ""
@@ -73,15 +78,113 @@ class EmailMessage:
     return as_str
 
 
-def get_gmail_service(credentials: Credentials) -> GmailService | None:
+@dataclasses.dataclass
+class EmailThread:
+  id: str
+  messages: list[EmailMessage]
+  # Id of the newest message that matched the fetch query, e.g. the newest
+  # unread one. The thread is triaged again whenever this changes.
+  newest_id: str = ''
+
+  @classmethod
+  def from_json(cls, data: dict, newest_id: str = '') -> 'EmailThread':
+    # Drafts, including the agent's own replies, are not part of the
+    # conversation being triaged.
+    messages = [
+        EmailMessage.from_json(m)
+        for m in data.get("messages", [])
+        if 'DRAFT' not in m.get("labelIds", [])
+    ]
+    return EmailThread(id=data["id"], messages=messages, newest_id=newest_id)
+
+  @property
+  def subject(self) -> str:
+    return self.messages[0].subject if self.messages else ''
+
+  @property
+  def newest_message(self) -> EmailMessage | None:
+    """The message `newest_id` refers to, or else the last one."""
+    for message in self.messages:
+      if message.id == self.newest_id:
+        return message
+    return self.messages[-1] if self.messages else None
+
+  def to_string(self, short: bool = False) -> str:
+    as_str = f'Email thread of {len(self.messages)} messages, oldest first:\n\n'
+    as_str += '\n\n'.join(m.to_string(short) for m in self.messages)
+    return as_str
+
+
+def get_gmail_service(credentials: 'Credentials') -> GmailService | None:
+  from googleapiclient.errors import HttpError  # type: ignore
+
   try:
-    service = build('gmail', 'v1', credentials=credentials)
+    service = discovery_docs.build_service('gmail', 'v1', credentials)
     return service
   except HttpError as error:
     print(f'An error occurred: {error}')
     return None
 
 
+def _build_query(
+    start_date: str | None = None,
+    end_date: str | None = None,
+    received_since: datetime.datetime | None = None,
+) -> str:
+  query = ''
+  if start_date:
+    query += f" after:{start_date.replace('-', '/')}"
+  if end_date:
+    query += f" before:{end_date.replace('-', '/')}"
+  if received_since:
+    timestamp = int(received_since.timestamp())
+    query += f" after:{timestamp}"
+  return query
+
+
+def _list_messages(
+    service: GmailService,
+    query: str,
+    unread_only: bool = False,
+) -> Iterator[dict]:
+  """Yields the id and thread id of matching inbox messages, newest first."""
+  import backoff
+  import httplib2
+
+  page_token = None
+  label_ids = ['INBOX']
+  if unread_only:
+    label_ids.append('UNREAD')
+  while True:
+    list_params = {
+        'userId': 'me',
+        'q': query,
+        'labelIds': label_ids,
+        'pageToken': page_token,
+    }
+
+    @backoff.on_exception(
+        backoff.expo,
+        (httplib2.error.ServerNotFoundError,),
+        max_tries=5,
+        on_giveup=lambda e: print(f'Too many failures: {e}')
+    )
+    def call_with_backoff():
+      return service.users().messages().list(**list_params).execute()
+
+    results = call_with_backoff()
+    messages_info = results.get("messages", [])
+
+    if not messages_info:
+      return
+
+    yield from messages_info
+
+    page_token = results.get("nextPageToken")
+    if not page_token:
+      return
+
+
 def get_emails_impl(
     service: GmailService,
     *,
@@ -92,64 +195,26 @@ def get_emails_impl(
     received_since: datetime.datetime | None = None,
 ) -> list[EmailMessage]:
     """Gets emails from the user's inbox."""
+    from googleapiclient.errors import HttpError  # type: ignore
+
     if not (num_emails or start_date or end_date):
       # If nothing is provided, fetch a reasonable number of emails.
       num_emails = 100
 
     try:
-      query = ''
-      if start_date:
-        query += f" after:{start_date.replace('-', '/')}"
-      if end_date:
-        query += f" before:{end_date.replace('-', '/')}"
-      if received_since:
-        timestamp = int(received_since.timestamp())
-        query += f" after:{timestamp}"
-
+      query = _build_query(start_date, end_date, received_since)
       emails: list[EmailMessage] = []
-      page_token = None
-      label_ids = ['INBOX']
-      if unread_only:
-        label_ids.append('UNREAD')
-      while True:
-        list_params = {
-            'userId': 'me',
-            'q': query,
-            'labelIds': label_ids,
-            'pageToken': page_token,
-        }
-
-        @backoff.on_exception(
-            backoff.expo,
-            (httplib2.error.ServerNotFoundError,),
-            max_tries=5,
-            on_giveup=lambda e: print(f'Too many failures: {e}')
-        )
-        def call_with_backoff():
-          return service.users().messages().list(**list_params).execute()
-
-        results = call_with_backoff()
-        messages_info = results.get("messages", [])
-
-        if not messages_info:
+      for msg_info in _list_messages(service, query, unread_only):
+        if num_emails is not None and len(emails) >= num_emails:
           break
 
-        for msg_info in messages_info:
-          if num_emails is not None and len(emails) >= num_emails:
-            return emails
-
-          msg = (
-              service.users()
-              .messages()
-              .get(userId="me", id=msg_info["id"], format="full")
-              .execute()
-          )
-          emails.append(EmailMessage.from_json(msg))
-
-        # 4. Get the next page token to continue the loop.
-        page_token = results.get("nextPageToken")
-        if not page_token:
-          break
+        msg = (
+            service.users()
+            .messages()
+            .get(userId="me", id=msg_info["id"], format="full")
+            .execute()
+        )
+        emails.append(EmailMessage.from_json(msg))
 
       return emails
 
@@ -158,7 +223,57 @@ def get_emails_impl(
       return []
 
 
-def make_get_emails_tool(credentials: Credentials) -> Callable:
+def get_threads_impl(
+    service: GmailService,
+    *,
+    num_threads: int = 100,
+    unread_only: bool = False,
+    received_since: datetime.datetime | None = None,
+    known_ids: Container[str] | None = None,
+) -> list[EmailThread]:
+  """Gets the conversations that matching inbox messages belong to.
+
+  Matching messages are grouped by thread and each thread is fetched once, in
+  full. Threads whose newest matching message id is in `known_ids` are skipped
+  without being fetched. Listing stops as soon as `num_threads` new threads
+  have been found.
+  """
+  from googleapiclient.errors import HttpError  # type: ignore
+
+  try:
+    query = _build_query(received_since=received_since)
+    seen: set[str] = set()
+    new_threads: list[tuple[str, str]] = []
+    for msg_info in _list_messages(service, query, unread_only):
+      thread_id = msg_info["threadId"]
+      if thread_id in seen:
+        continue
+      # Messages are listed newest first, so this is the thread's newest one.
+      seen.add(thread_id)
+      if known_ids is not None and msg_info["id"] in known_ids:
+        continue
+      new_threads.append((thread_id, msg_info["id"]))
+      if len(new_threads) >= num_threads:
+        break
+
+    threads: list[EmailThread] = []
+    for thread_id, newest_id in new_threads:
+      data = (
+          service.users()
+          .threads()
+          .get(userId="me", id=thread_id, format="full")
+          .execute()
+      )
+      threads.append(EmailThread.from_json(data, newest_id=newest_id))
+
+    return threads
+
+  except HttpError as error:
+    print(f"An error occurred: {error}")
+    return []
+
+
+def make_get_emails_tool(credentials: 'Credentials') -> Callable:
   service = get_gmail_service(credentials)
 
   def get_emails(
@@ -191,6 +306,30 @@ def make_get_emails_tool(credentials: Credentials) -> Callable:
   return get_emails
 
 
+def update_thread_labels(
+    service: GmailService,
+    thread: EmailThread,
+    star: bool = False,
+    mark_as_read: bool = False,
+) -> EmailThread | None:
+  """Updates labels on the messages in `thread` with a single request.
+
+  Only the messages that were fetched are changed, so a reply that arrived
+  since is left unread and gets triaged on its own.
+  """
+  try:
+    body: dict[str, Any] = {'ids': [m.id for m in thread.messages]}
+    if star:
+      body['addLabelIds'] = ['STARRED']
+    if mark_as_read:
+      body['removeLabelIds'] = ['UNREAD']
+    service.users().messages().batchModify(userId='me', body=body).execute()
+    return thread
+  except Exception as e:
+    print(f'An error occurred: {e}')
+    return None
+
+
 def update_labels(
     service: GmailService,
     message: EmailMessage,
@@ -219,17 +358,62 @@ def create_draft(
     *,
     message: str,
     reply_to: str,
-) -> None:
+    tag: str | None = None,
+) -> str:
+  """Creates a draft reply in thread `reply_to` and returns the draft id.
+
+  If given, `tag` is stored in the draft's DRAFT_TAG_HEADER for find_draft.
+  """
+  from email.message import EmailMessage as EmailMessageBuiltin
+
   # TODO: get other recipients and send it to them.
   obj = EmailMessageBuiltin()
   obj.set_content(message)
+  if tag:
+    obj[DRAFT_TAG_HEADER] = tag
   # message['To'] = 'Ignore'
   # message['From'] = 'Ignore'
   # TODO: fetch subject from original message.
   # message['Subject'] = 'Automated draft'
   encoded = base64.urlsafe_b64encode(obj.as_bytes()).decode()
   body = { 'message': { 'threadId': reply_to, 'raw': encoded} }
-  service.users().drafts().create(userId="me", body=body).execute()
+  draft = service.users().drafts().create(userId="me", body=body).execute()
+  return draft['id']
+
+
+def find_draft(service: GmailService, thread_id: str, tag: str) -> str | None:
+  """Returns the id of the draft in `thread_id` created with `tag`, if any."""
+  page_token = None
+  while True:
+    results = (
+        service.users()
+        .drafts()
+        .list(userId='me', pageToken=page_token)
+        .execute()
+    )
+    for draft in results.get('drafts', []):
+      if draft.get('message', {}).get('threadId') != thread_id:
+        continue
+      data = (
+          service.users()
+          .drafts()
+          .get(
+              userId='me',
+              id=draft['id'],
+              format='metadata',
+              metadataHeaders=[DRAFT_TAG_HEADER],
+          )
+          .execute()
+      )
+      headers = data['message'].get('payload', {}).get('headers', [])
+      if any(
+          h['name'].lower() == DRAFT_TAG_HEADER.lower() and h['value'] == tag
+          for h in headers
+      ):
+        return draft['id']
+    page_token = results.get('nextPageToken')
+    if not page_token:
+      return None
 
 
 if __name__ == '__main__':
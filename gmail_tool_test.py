@@ -0,0 +1,247 @@
+import importlib.util
+import unittest
+
+import gmail_tool
+
+# get_threads_impl retries and reports errors with these.
+_HAS_CLIENT_LIBRARIES = all(
+    importlib.util.find_spec(m)
+    for m in ('backoff', 'googleapiclient', 'httplib2')
+)
+
+
+def _messages(*ids: str) -> list[gmail_tool.EmailMessage]:
+  return [gmail_tool.EmailMessage(id=id) for id in ids]
+
+
+def _message_json(
+    id: str,
+    thread_id: str,
+    subject: str = 'Lunch?',
+    date: str = 'Mon, 6 Oct 2025 12:00:00 +0000',
+    labels: tuple[str, ...] = ('INBOX', 'UNREAD'),
+) -> dict:
+  headers = {'Subject': subject, 'From': 'alice@example.com', 'Date': date}
+  return {
+      'id': id,
+      'threadId': thread_id,
+      'labelIds': list(labels),
+      'snippet': '',
+      'payload': {
+          'headers': [{'name': k, 'value': v} for k, v in headers.items() if v],
+          'body': {},
+      },
+  }
+
+
+class _Request:
+
+  def __init__(self, result: dict):
+    self._result = result
+
+  def execute(self) -> dict:
+    return self._result
+
+
+class _Messages:
+
+  def __init__(self, service: 'FakeGmailService'):
+    self._service = service
+
+  def list(self, userId: str, pageToken: str | None = None, **kwargs):
+    self._service.calls.append('messages.list')
+    start = int(pageToken or 0)
+    end = start + self._service.page_size
+    result: dict = {'messages': self._service.listed[start:end]}
+    if end < len(self._service.listed):
+      result['nextPageToken'] = str(end)
+    return _Request(result)
+
+  def batchModify(self, userId: str, body: dict) -> _Request:
+    self._service.calls.append('messages.batchModify')
+    self._service.modified.append(body)
+    return _Request({})
+
+
+class _Threads:
+
+  def __init__(self, service: 'FakeGmailService'):
+    self._service = service
+
+  def get(self, userId: str, id: str, **kwargs) -> _Request:
+    self._service.calls.append(f'threads.get:{id}')
+    messages = self._service.threads_by_id[id]
+    return _Request({'id': id, 'messages': messages})
+
+
+class _Drafts:
+
+  def __init__(self, service: 'FakeGmailService'):
+    self._service = service
+
+  def list(self, userId: str, pageToken: str | None = None) -> _Request:
+    self._service.calls.append('drafts.list')
+    drafts = [
+        {'id': draft_id, 'message': {'threadId': thread_id}}
+        for draft_id, (thread_id, _) in self._service.drafts_by_id.items()
+    ]
+    return _Request({'drafts': drafts})
+
+  def get(self, userId: str, id: str, **kwargs) -> _Request:
+    self._service.calls.append(f'drafts.get:{id}')
+    thread_id, headers = self._service.drafts_by_id[id]
+    return _Request({
+        'id': id,
+        'message': {
+            'threadId': thread_id,
+            'payload': {
+                'headers': [{'name': k, 'value': v} for k, v in headers.items()]
+            },
+        },
+    })
+
+
+class FakeGmailService:
+  """Serves the Gmail API calls gmail_tool makes from in-memory data."""
+
+  def __init__(self) -> None:
+    # What messages.list returns, newest first, `page_size` per page.
+    self.listed: list[dict] = []
+    self.page_size = 100
+    self.threads_by_id: dict[str, list[dict]] = {}
+    # Draft id -> (thread id, headers).
+    self.drafts_by_id: dict[str, tuple[str, dict[str, str]]] = {}
+    self.modified: list[dict] = []
+    self.calls: list[str] = []
+
+  def add_thread(self, thread_id: str, *message_ids: str) -> None:
+    """Adds a thread of unread messages, oldest first."""
+    messages = [_message_json(id, thread_id) for id in message_ids]
+    self.threads_by_id[thread_id] = messages
+    self.listed += [{'id': m['id'], 'threadId': thread_id} for m in messages]
+    self.listed.sort(key=lambda m: m['id'], reverse=True)
+
+  def users(self) -> 'FakeGmailService':
+    return self
+
+  def messages(self) -> _Messages:
+    return _Messages(self)
+
+  def threads(self) -> _Threads:
+    return _Threads(self)
+
+  def drafts(self) -> _Drafts:
+    return _Drafts(self)
+
+
+@unittest.skipUnless(_HAS_CLIENT_LIBRARIES, 'Gmail client libraries missing')
+class GetThreadsTest(unittest.TestCase):
+
+  def setUp(self):
+    # Message ids sort in the order they were received.
+    self.service = FakeGmailService()
+    self.service.add_thread('t1', 'm1', 'm3')
+    self.service.add_thread('t2', 'm2')
+
+  def test_groups_messages_by_thread(self):
+    threads = gmail_tool.get_threads_impl(self.service)
+    self.assertEqual([t.id for t in threads], ['t1', 't2'])
+    self.assertEqual([t.newest_id for t in threads], ['m3', 'm2'])
+    self.assertEqual([m.id for m in threads[0].messages], ['m1', 'm3'])
+
+  def test_fetches_each_thread_once(self):
+    gmail_tool.get_threads_impl(self.service)
+    fetches = [c for c in self.service.calls if c.startswith('threads.get')]
+    self.assertEqual(fetches, ['threads.get:t1', 'threads.get:t2'])
+
+  def test_known_threads_are_not_fetched(self):
+    threads = gmail_tool.get_threads_impl(self.service, known_ids={'m3'})
+    self.assertEqual([t.id for t in threads], ['t2'])
+    self.assertNotIn('threads.get:t1', self.service.calls)
+
+  def test_thread_with_new_message_is_not_known(self):
+    threads = gmail_tool.get_threads_impl(self.service, known_ids={'m1'})
+    self.assertEqual([t.id for t in threads], ['t1', 't2'])
+
+  def test_stops_listing_after_num_threads(self):
+    self.service.page_size = 1
+    threads = gmail_tool.get_threads_impl(self.service, num_threads=1)
+    self.assertEqual([t.id for t in threads], ['t1'])
+    self.assertEqual(self.service.calls.count('messages.list'), 1)
+
+
+class EmailThreadTest(unittest.TestCase):
+
+  def test_drafts_are_dropped(self):
+    data = {
+        'id': 't1',
+        'messages': [
+            _message_json('m1', 't1'),
+            _message_json('d1', 't1', subject='', date='', labels=('DRAFT',)),
+        ],
+    }
+    thread = gmail_tool.EmailThread.from_json(data, newest_id='m1')
+    self.assertEqual([m.id for m in thread.messages], ['m1'])
+
+  def test_unparseable_date_is_left_empty(self):
+    message = gmail_tool.EmailMessage.from_json(
+        _message_json('m1', 't1', date='last Tuesday')
+    )
+    self.assertEqual(message.date, '')
+
+  def test_date_in_gmt(self):
+    message = gmail_tool.EmailMessage.from_json(
+        _message_json('m1', 't1', date='Mon, 6 Oct 2025 12:00:00 GMT')
+    )
+    self.assertEqual(message.date.hour, 12)  # type: ignore
+
+  def test_newest_message(self):
+    thread = gmail_tool.EmailThread(
+        id='t1', messages=_messages('m1', 'm2'), newest_id='m1'
+    )
+    self.assertEqual(thread.newest_message, thread.messages[0])
+    thread.newest_id = ''
+    self.assertEqual(thread.newest_message, thread.messages[1])
+
+
+class UpdateThreadLabelsTest(unittest.TestCase):
+
+  def test_only_fetched_messages_are_modified(self):
+    service = FakeGmailService()
+    thread = gmail_tool.EmailThread(id='t1', messages=_messages('m1', 'm2'))
+    gmail_tool.update_thread_labels(
+        service, thread, star=True, mark_as_read=True
+    )
+    self.assertEqual(
+        service.modified,
+        [{
+            'ids': ['m1', 'm2'],
+            'addLabelIds': ['STARRED'],
+            'removeLabelIds': ['UNREAD'],
+        }],
+    )
+
+
+class FindDraftTest(unittest.TestCase):
+
+  def setUp(self):
+    self.service = FakeGmailService()
+    tag = gmail_tool.DRAFT_TAG_HEADER
+    self.service.drafts_by_id = {
+        'user': ('t1', {}),
+        'older': ('t1', {tag: 'draft:m1'}),
+        'other-thread': ('t2', {tag: 'draft:m2'}),
+        'agent': ('t1', {tag: 'draft:m2'}),
+    }
+
+  def test_finds_draft_with_tag(self):
+    draft_id = gmail_tool.find_draft(self.service, 't1', 'draft:m2')
+    self.assertEqual(draft_id, 'agent')
+
+  def test_ignores_untagged_and_other_threads(self):
+    self.assertIsNone(gmail_tool.find_draft(self.service, 't1', 'draft:m3'))
+    self.assertNotIn('drafts.get:other-thread', self.service.calls)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,261 @@
+import dataclasses
+import datetime
+import json
+import sqlite3
+import time
+
+import gmail_tool
+
+QUEUE_DB = './queue.db'
+
+# Per-thread states, in the order they are reached.
+FETCHED = 'fetched'
+CLASSIFIED = 'classified'
+DRAFTED = 'drafted'
+LABELED = 'labeled'
+# Terminal state for threads replaced by a newer row for the same conversation.
+SUPERSEDED = 'superseded'
+# Terminal state for threads that failed MAX_ATTEMPTS times. They are left
+# unread for the user, and their rows are kept so that they are not listed and
+# classified again; delete a row to have its thread retried.
+FAILED = 'failed'
+
+_FINISHED = (LABELED, SUPERSEDED, FAILED)
+
+MAX_ATTEMPTS = 5
+# Delay before retrying a failed thread, doubled after each failure, so that a
+# Gemini or Gmail outage of up to about an hour does not use up its attempts.
+RETRY_DELAY = datetime.timedelta(minutes=5)
+# How long triaged threads and actions are remembered before being pruned.
+RETENTION = datetime.timedelta(days=7)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+  id TEXT PRIMARY KEY,
+  thread_id TEXT NOT NULL,
+  thread TEXT NOT NULL,
+  state TEXT NOT NULL,
+  decision TEXT,
+  draft TEXT,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  retry_at REAL NOT NULL DEFAULT 0,
+  updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threads_by_thread_id ON threads (thread_id);
+CREATE TABLE IF NOT EXISTS actions (
+  key TEXT PRIMARY KEY,
+  done INTEGER NOT NULL DEFAULT 0,
+  result TEXT,
+  updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+  key TEXT PRIMARY KEY,
+  value TEXT NOT NULL
+);
+"""
+
+
+@dataclasses.dataclass
+class WorkItem:
+  thread: gmail_tool.EmailThread
+  state: str
+  decision: str | None = None
+  draft: str | None = None
+  attempts: int = 0
+
+
+def _dump_thread(thread: gmail_tool.EmailThread) -> str:
+  data = dataclasses.asdict(thread)
+  for message in data['messages']:
+    if isinstance(message['date'], datetime.datetime):
+      message['date'] = message['date'].isoformat()
+  return json.dumps(data)
+
+
+def _load_thread(raw: str) -> gmail_tool.EmailThread:
+  data = json.loads(raw)
+  messages = []
+  for message in data.pop('messages'):
+    if message['date']:
+      message['date'] = datetime.datetime.fromisoformat(message['date'])
+    messages.append(gmail_tool.EmailMessage(**message))
+  return gmail_tool.EmailThread(messages=messages, **data)
+
+
+class WorkQueue:
+  """Persistent triage progress, so a restart resumes where it stopped.
+
+  Threads are keyed by their newest unread message, so a conversation that
+  gets a new message is queued again; any older row for it that is still
+  pending is then SUPERSEDED, so each conversation has one decision at a time.
+
+  Each one moves through FETCHED -> CLASSIFIED -> (DRAFTED) -> LABELED, and
+  the result of every step is committed before the next one starts. A thread
+  that fails is retried after RETRY_DELAY, doubling each time, and is moved to
+  FAILED after MAX_ATTEMPTS so it cannot block the queue. Side effects that are
+  not safe to repeat are wrapped in action records: if a run dies after
+  starting one but before recording it, the next run can tell. Labeled and
+  superseded threads and finished actions are pruned after RETENTION.
+  """
+
+  def __init__(self, path: str = QUEUE_DB):
+    self._conn = sqlite3.connect(path)
+    self._conn.executescript(_SCHEMA)
+
+  def close(self) -> None:
+    self._conn.close()
+
+  def __contains__(self, newest_id: object) -> bool:
+    """Whether a thread with this newest message id has been queued."""
+    row = self._conn.execute(
+        'SELECT 1 FROM threads WHERE id = ?', (newest_id,)
+    ).fetchone()
+    return row is not None
+
+  def add(self, threads: list[gmail_tool.EmailThread]) -> None:
+    """Queues new threads. Threads that are already queued are left as-is."""
+    now = time.time()
+    with self._conn:
+      for t in threads:
+        inserted = self._conn.execute(
+            'INSERT OR IGNORE INTO threads (id, thread_id, thread, state, '
+            'updated) VALUES (?, ?, ?, ?, ?)',
+            (t.newest_id, t.id, _dump_thread(t), FETCHED, now),
+        ).rowcount
+        if inserted:
+          self._conn.execute(
+              'UPDATE threads SET state = ?, updated = ? '
+              'WHERE thread_id = ? AND id != ? AND state NOT IN (?, ?, ?)',
+              (SUPERSEDED, now, t.id, t.newest_id, *_FINISHED),
+          )
+
+  def pending(self, limit: int | None = None) -> list[WorkItem]:
+    """Returns threads that have not been fully triaged, oldest first.
+
+    Threads waiting out their retry delay are left out.
+
+    Args:
+      limit: The most threads to return, or None for all of them.
+    """
+    rows = self._conn.execute(
+        'SELECT thread, state, decision, draft, attempts FROM threads '
+        'WHERE state NOT IN (?, ?, ?) AND retry_at <= ? ORDER BY rowid LIMIT ?',
+        (*_FINISHED, time.time(), -1 if limit is None else limit),
+    )
+    return [
+        WorkItem(_load_thread(thread), state, decision, draft, attempts)
+        for thread, state, decision, draft, attempts in rows
+    ]
+
+  def advance(self, item: WorkItem, state: str, **fields) -> None:
+    """Records that `item` has reached `state`."""
+    with self._conn:
+      self._advance(item, state, **fields)
+
+  def _advance(
+      self,
+      item: WorkItem,
+      state: str,
+      decision: str | None = None,
+      draft: str | None = None,
+  ) -> None:
+    item.state = state
+    item.decision = decision or item.decision
+    item.draft = draft or item.draft
+    self._conn.execute(
+        'UPDATE threads SET state = ?, decision = ?, draft = ?, attempts = ?, '
+        'updated = ? WHERE id = ?',
+        (
+            item.state,
+            item.decision,
+            item.draft,
+            item.attempts,
+            time.time(),
+            item.thread.newest_id,
+        ),
+    )
+
+  def record_failure(self, item: WorkItem) -> bool:
+    """Counts a failed attempt at `item`'s current step.
+
+    The item is not pending again until its retry delay has passed.
+
+    Returns:
+      True if the item has now used up its attempts and was marked FAILED.
+    """
+    item.attempts += 1
+    state = FAILED if item.attempts >= MAX_ATTEMPTS else item.state
+    delay = RETRY_DELAY.total_seconds() * 2 ** (item.attempts - 1)
+    with self._conn:
+      self._advance(item, state)
+      self._conn.execute(
+          'UPDATE threads SET retry_at = ? WHERE id = ?',
+          (time.time() + delay, item.thread.newest_id),
+      )
+    return state == FAILED
+
+  def action_interrupted(self, key: str) -> bool:
+    """Whether an action was started but never recorded as complete."""
+    row = self._conn.execute(
+        'SELECT done FROM actions WHERE key = ?', (key,)
+    ).fetchone()
+    return row is not None and not row[0]
+
+  def start_action(self, key: str) -> None:
+    with self._conn:
+      self._conn.execute(
+          'INSERT OR IGNORE INTO actions (key, updated) VALUES (?, ?)',
+          (key, time.time()),
+      )
+
+  def complete_action(
+      self,
+      key: str,
+      result: str | None,
+      item: WorkItem,
+      state: str,
+  ) -> None:
+    """Marks an action done and advances its item in a single transaction."""
+    with self._conn:
+      self._conn.execute(
+          'INSERT OR REPLACE INTO actions (key, done, result, updated) '
+          'VALUES (?, 1, ?, ?)',
+          (key, result, time.time()),
+      )
+      self._advance(item, state)
+
+  def prune(self, retention: datetime.timedelta = RETENTION) -> None:
+    """Forgets threads and actions finished before `retention`.
+
+    FAILED threads are kept; see FAILED.
+    """
+    cutoff = time.time() - retention.total_seconds()
+    with self._conn:
+      self._conn.execute(
+          'DELETE FROM threads WHERE state IN (?, ?) AND updated < ?',
+          (LABELED, SUPERSEDED, cutoff),
+      )
+      self._conn.execute(
+          'DELETE FROM actions WHERE done = 1 AND updated < ?', (cutoff,)
+      )
+
+  def get_checkpoint(self) -> datetime.datetime:
+    row = self._conn.execute(
+        "SELECT value FROM meta WHERE key = 'checkpoint'"
+    ).fetchone()
+    if row is None:
+      return datetime.datetime.now(datetime.UTC)
+    return datetime.datetime.fromisoformat(row[0])
+
+  def set_checkpoint(self, ckpt: datetime.datetime) -> None:
+    with self._conn:
+      self._conn.execute(
+          "INSERT OR REPLACE INTO meta (key, value) VALUES ('checkpoint', ?)",
+          (ckpt.isoformat(),),
+      )
+
+
+if __name__ == '__main__':
+  queue = WorkQueue()
+  for item in queue.pending():
+    print(item.state, item.decision, item.thread.subject)
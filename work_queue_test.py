@@ -0,0 +1,172 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import gmail_agent
+import gmail_tool
+import work_queue
+
+
+def _thread(newest_id: str = 'm1') -> gmail_tool.EmailThread:
+  message = gmail_tool.EmailMessage(
+      id=newest_id,
+      thread_id='t1',
+      subject='Lunch?',
+      sender='alice@example.com',
+  )
+  return gmail_tool.EmailThread(id='t1', messages=[message], newest_id=newest_id)
+
+
+class WorkQueueTest(unittest.TestCase):
+
+  def setUp(self):
+    self.queue = work_queue.WorkQueue(':memory:')
+    self.addCleanup(self.queue.close)
+
+  def test_add_round_trips_thread(self):
+    thread = _thread()
+    self.queue.add([thread])
+    [item] = self.queue.pending()
+    self.assertEqual(item.thread, thread)
+    self.assertEqual(item.state, work_queue.FETCHED)
+    self.assertIn('m1', self.queue)
+    self.assertNotIn('m2', self.queue)
+
+  def test_progress_survives_reopening(self):
+    path = os.path.join(tempfile.mkdtemp(), 'queue.db')
+    queue = work_queue.WorkQueue(path)
+    queue.add([_thread()])
+    [item] = queue.pending()
+    queue.advance(item, work_queue.CLASSIFIED, decision='respond', draft='Sure!')
+    queue.close()
+
+    queue = work_queue.WorkQueue(path)
+    self.addCleanup(queue.close)
+    [item] = queue.pending()
+    self.assertEqual(item.state, work_queue.CLASSIFIED)
+    self.assertEqual(item.draft, 'Sure!')
+
+  def test_labeled_items_are_not_pending(self):
+    self.queue.add([_thread()])
+    [item] = self.queue.pending()
+    self.queue.advance(item, work_queue.LABELED)
+    self.assertEqual(self.queue.pending(), [])
+
+  def test_pending_limit_returns_oldest_first(self):
+    threads = [_thread(f'm{i}') for i in range(3)]
+    for i, thread in enumerate(threads):
+      thread.id = f't{i}'
+    self.queue.add(threads)
+    items = self.queue.pending(limit=2)
+    self.assertEqual([i.thread.newest_id for i in items], ['m0', 'm1'])
+    self.assertEqual(len(self.queue.pending()), 3)
+
+  def test_newer_message_supersedes_pending_row(self):
+    self.queue.add([_thread('m1')])
+    [item] = self.queue.pending()
+    self.queue.advance(item, work_queue.CLASSIFIED, decision='ignore')
+    self.queue.add([_thread('m2')])
+    [item] = self.queue.pending()
+    self.assertEqual(item.thread.newest_id, 'm2')
+    self.assertEqual(item.state, work_queue.FETCHED)
+
+  def test_requeueing_same_row_does_not_supersede_it(self):
+    self.queue.add([_thread('m1')])
+    self.queue.add([_thread('m1')])
+    [item] = self.queue.pending()
+    self.assertEqual(item.thread.newest_id, 'm1')
+
+  def test_failed_items_stop_after_max_attempts(self):
+    self.queue.add([_thread()])
+    [item] = self.queue.pending()
+    for _ in range(work_queue.MAX_ATTEMPTS - 1):
+      self.assertFalse(self.queue.record_failure(item))
+    self.assertTrue(self.queue.record_failure(item))
+    self.assertEqual(item.state, work_queue.FAILED)
+
+  def test_failed_items_wait_for_retry_delay(self):
+    self.queue.add([_thread()])
+    [item] = self.queue.pending()
+    self.queue.record_failure(item)
+    self.assertEqual(self.queue.pending(), [])
+    delay = work_queue.RETRY_DELAY.total_seconds()
+    later = work_queue.time.time() + delay + 1
+    with mock.patch.object(work_queue.time, 'time', return_value=later):
+      [item] = self.queue.pending()
+    self.assertEqual(item.attempts, 1)
+
+  def test_prune_forgets_labeled_items(self):
+    self.queue.add([_thread()])
+    [item] = self.queue.pending()
+    self.queue.advance(item, work_queue.LABELED)
+    self.queue.prune(retention=datetime.timedelta(seconds=-1))
+    self.assertNotIn('m1', self.queue)
+
+  def test_prune_keeps_failed_items(self):
+    self.queue.add([_thread()])
+    [item] = self.queue.pending()
+    self.queue.advance(item, work_queue.FAILED)
+    self.queue.prune(retention=datetime.timedelta(seconds=-1))
+    self.assertIn('m1', self.queue)
+
+  def test_action_interrupted(self):
+    self.assertFalse(self.queue.action_interrupted('draft:m1'))
+    self.queue.start_action('draft:m1')
+    self.assertTrue(self.queue.action_interrupted('draft:m1'))
+
+
+@mock.patch.object(gmail_agent.log, 'log')
+class CreateDraftOnceTest(unittest.TestCase):
+
+  def setUp(self):
+    self.queue = work_queue.WorkQueue(':memory:')
+    self.addCleanup(self.queue.close)
+    self.queue.add([_thread()])
+    [self.item] = self.queue.pending()
+    self.queue.advance(
+        self.item, work_queue.CLASSIFIED, decision='respond', draft='Sure!'
+    )
+
+  @mock.patch.object(gmail_tool, 'find_draft')
+  @mock.patch.object(gmail_tool, 'create_draft', return_value='d1')
+  def test_creates_draft(self, create_draft, find_draft, _):
+    gmail_agent._create_draft_once(None, self.queue, self.item)
+    create_draft.assert_called_once_with(
+        service=None, message='Sure!', reply_to='t1', tag='draft:m1'
+    )
+    find_draft.assert_not_called()
+    self.assertEqual(self.item.state, work_queue.DRAFTED)
+    self.assertFalse(self.queue.action_interrupted('draft:m1'))
+
+  @mock.patch.object(gmail_tool, 'find_draft', return_value='d1')
+  @mock.patch.object(gmail_tool, 'create_draft')
+  def test_interrupted_draft_is_not_duplicated(
+      self, create_draft, find_draft, _
+  ):
+    self.queue.start_action('draft:m1')
+    gmail_agent._create_draft_once(None, self.queue, self.item)
+    find_draft.assert_called_once_with(None, 't1', 'draft:m1')
+    create_draft.assert_not_called()
+    self.assertEqual(self.item.state, work_queue.DRAFTED)
+
+  @mock.patch.object(gmail_tool, 'find_draft', return_value=None)
+  @mock.patch.object(gmail_tool, 'create_draft', return_value='d1')
+  def test_interrupted_before_create_creates_draft(
+      self, create_draft, find_draft, _
+  ):
+    self.queue.start_action('draft:m1')
+    gmail_agent._create_draft_once(None, self.queue, self.item)
+    find_draft.assert_called_once()
+    create_draft.assert_called_once()
+    self.assertEqual(self.item.state, work_queue.DRAFTED)
+
+  def test_missing_draft_text_raises(self, _):
+    self.item.draft = None
+    with self.assertRaises(ValueError):
+      gmail_agent._create_draft_once(None, self.queue, self.item)
+
+
+if __name__ == '__main__':
+  unittest.main()